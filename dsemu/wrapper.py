@@ -0,0 +1,291 @@
+import functools
+import os
+import re
+import selectors
+import time
+from http.client import HTTPConnection, HTTPException
+from types import TracebackType
+from typing import TYPE_CHECKING, Optional, Type
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    import subprocess
+
+DEFAULT_PROJECT = "test"
+DEFAULT_HOST = "http://localhost:8088"
+RESET_ENDPOINT = "/reset"
+SHUTDOWN_ENDPOINT = "/shutdown"
+HEALTHCHECK_ENDPOINT = ""
+DEFAULT_TIMEOUT = 30
+
+_READY_RE = re.compile(rb"is now running")
+_EMULATOR_HOST_ENV = "DATASTORE_EMULATOR_HOST"
+_PROJECT_ID_ENV = "DATASTORE_PROJECT_ID"
+_ENV_KEYS = (_EMULATOR_HOST_ENV, _PROJECT_ID_ENV)
+
+
+class EmulatorException(Exception):
+    pass
+
+
+def _normalize_host(host: str) -> str:
+    """
+    Rewrite a literal localhost host to 127.0.0.1 so that requests against
+    the emulator skip name resolution entirely.
+    """
+    if urlparse(host).hostname == "localhost":
+        host = host.replace("localhost", "127.0.0.1", 1)
+    return host
+
+
+@functools.lru_cache(maxsize=8)
+def _probe_existing(host: str, path: str) -> bool:
+    """
+    Check whether an externally configured emulator answers its healthcheck.
+
+    The result is cached per (host, path) so that constructing several
+    Emulators in one process pays for the HTTP probe only once; stop()
+    clears the cache.
+    """
+    conn = HTTPConnection(urlparse(host).netloc)
+    try:
+        conn.request("GET", path if path else "/")
+        return conn.getresponse().status == 200
+    except (OSError, HTTPException):
+        return False
+    finally:
+        conn.close()
+
+
+@functools.lru_cache(maxsize=1)
+def _locate_gcloud() -> str:
+    import shutil
+
+    gcloud = shutil.which("gcloud")
+    if gcloud is None:
+        raise OSError(2, "binary not found", "gcloud")
+    return gcloud
+
+
+class Emulator:
+    """
+    Emulator wraps the datastore emulator process enabling programmatic control
+    of the emulator (start, stop, reset), thus making it possible to use the
+    emulator for running tests.
+
+    By default the wrapper runs the emulator using its in-memory storage and
+    disables the eventual consistency simulation for the sake of avoiding
+    random failures during tests.
+
+    The wrapper will reuse the currently running instance of the emulator if it
+    is available and configured correctly (i.e. if the required environment
+    variables are present).
+    """
+
+    __slots__ = (
+        "_project",
+        "_host",
+        "_netloc",
+        "_reset_endpoint",
+        "_shutdown_endpoint",
+        "_healthcheck_endpoint",
+        "_timeout",
+        "_instance",
+        "_conn",
+    )
+
+    _GCLOUD_STATIC = (
+        "beta",
+        "emulators",
+        "datastore",
+        "start",
+        "--consistency=1.0",
+        "--no-store-on-disk",
+    )
+
+    def __init__(
+        self,
+        project: str = DEFAULT_PROJECT,
+        host: str = DEFAULT_HOST,
+        reset_endpoint: str = RESET_ENDPOINT,
+        shutdown_endpoint: str = SHUTDOWN_ENDPOINT,
+        healthcheck_endpoint: str = HEALTHCHECK_ENDPOINT,
+        timeout: int = DEFAULT_TIMEOUT,
+    ) -> None:
+        self._project: str = project
+        self._host: str = _normalize_host(host)
+        self._netloc: str = urlparse(self._host).netloc
+        self._reset_endpoint = reset_endpoint
+        self._shutdown_endpoint = shutdown_endpoint
+        self._healthcheck_endpoint = healthcheck_endpoint
+        self._timeout = timeout
+        self._instance: Optional["subprocess.Popen"] = None
+        self._conn: Optional[HTTPConnection] = None
+
+    def __enter__(self) -> "Emulator":
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] = None,
+        value: BaseException = None,
+        traceback: TracebackType = None,
+    ):
+        self.stop()
+
+    def start(self) -> None:
+        """
+        Either starts a new emulator process or configures the environment to
+        use the currently running emulator process.
+        """
+        if not self._is_already_running():
+            self._start()
+
+    def stop(self) -> None:
+        """
+        Performs a teardown of the emulator wrapper. If an instance of the
+        emulator was started in the process of initializing the wrapper it will
+        be stopped.
+        """
+        if self._instance:
+            self._teardown_instance()
+        self._close_connection()
+        _probe_existing.cache_clear()
+
+    def reset(self) -> None:
+        """
+        Reset resets the in-memory emulator storage. This works only when
+        in-memory option was set when starting the emulator instance.
+
+        Transient failures are retried a few times with a short backoff so
+        that a single flaky response doesn't abort a whole test session.
+        """
+        for attempt in range(5):
+            try:
+                self._request(self._reset_endpoint, method="POST")
+                return
+            except (EmulatorException, OSError, HTTPException):
+                if attempt == 4:
+                    raise
+                time.sleep(0.02 * 1.3 ** attempt)
+
+    def _is_already_running(self) -> bool:
+        host = os.getenv("DATASTORE_HOST")
+        if host is None:
+            return False
+
+        project = os.getenv("DATASTORE_PROJECT_ID")
+        if project is None:
+            return False
+
+        if not _probe_existing(host, self._healthcheck_endpoint):
+            return False
+
+        self._close_connection()
+        self._host = _normalize_host(host)
+        self._netloc = urlparse(self._host).netloc
+        self._project = project
+        return True
+
+    def _start(self) -> None:
+        import subprocess
+
+        emulator_host = self._netloc
+        self._instance = subprocess.Popen(
+            (
+                self._gcloud_binary,
+                *self._GCLOUD_STATIC,
+                f"--host-port={emulator_host}",
+                f"--project={self._project}",
+            ),
+            stderr=subprocess.PIPE,
+        )
+        self._confirm_startup()
+        os.environ[_EMULATOR_HOST_ENV] = emulator_host
+        os.environ[_PROJECT_ID_ENV] = self._project
+
+    def _teardown_instance(self) -> None:
+        import subprocess
+
+        if self._instance.poll() is None:
+            try:
+                self._request(self._shutdown_endpoint, method="POST")
+            except (EmulatorException, OSError, HTTPException):
+                self._instance.terminate()
+            try:
+                self._instance.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._instance.kill()
+                self._instance.wait()
+        for key in _ENV_KEYS:
+            os.environ.pop(key, None)
+
+    def _request(self, path: str, method: str = "GET"):
+        if self._conn is None:
+            self._conn = HTTPConnection(self._netloc)
+        try:
+            self._conn.request(method, path if path else "/")
+            resp = self._conn.getresponse()
+            resp.read()
+        except (OSError, HTTPException):
+            self._close_connection()
+            raise
+        self._check_status(resp.status, path)
+
+    @staticmethod
+    def _check_status(status: int, path: str) -> None:
+        if status != 200:
+            path = path.replace("/", "") if path != "" else "healthcheck"
+            msg = f"emulator {path} request failed with status code {status}"
+            raise EmulatorException(msg)
+
+    def _close_connection(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _is_healthy(self) -> bool:
+        try:
+            self._request(self._healthcheck_endpoint)
+        except (OSError, HTTPException):
+            return False
+        return True
+
+    def _confirm_startup(self) -> None:
+        deadline = time.monotonic() + self._timeout
+        stderr = self._instance.stderr
+        delay = 0.05
+        buf = b""
+        banner_seen = False
+        with selectors.DefaultSelector() as sel:
+            sel.register(stderr, selectors.EVENT_READ)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise EmulatorException("confirm startup timed out")
+                if banner_seen:
+                    # The banner is out (or stderr closed); probe with
+                    # backoff until the emulator actually serves requests.
+                    if self._is_healthy():
+                        return
+                    time.sleep(min(delay, remaining))
+                    delay = min(1.0, delay * 1.3)
+                    continue
+                events = sel.select(timeout=min(delay, remaining))
+                if events:
+                    chunk = os.read(stderr.fileno(), 4096)
+                    if chunk:
+                        buf += chunk
+                        banner_seen = _READY_RE.search(buf) is not None
+                    else:
+                        sel.unregister(stderr)
+                        banner_seen = True
+                    continue
+                if self._is_healthy():
+                    return
+                delay = min(1.0, delay * 1.3)
+
+    @property
+    def _gcloud_binary(self) -> str:
+        return _locate_gcloud()